@@ -6,22 +6,20 @@ import sys
 
 sys.path.append("/challenge")
 
-from abc import ABC
 from dataclasses import dataclass, field
-from typing import Dict, List, Optional, Tuple, Union
+from typing import Dict, FrozenSet, Iterable, List, Optional, Tuple, Union
 
 
-@dataclass
-class Statement(ABC):
+@dataclass(slots=True)
+class Statement:
     """Base class for all statements.
 
-    Args:
-        ABC (class): Helper class that provides a standard way to create an Abstract
-        Base Class (ABC) using inheritance.
+    Declares no fields of its own and is never instantiated directly; it only gives
+    the statement dataclasses a common type.
     """
 
 
-@dataclass
+@dataclass(slots=True)
 class ImportStatement(Statement):
     """Dataclass for import statements.
 
@@ -31,13 +29,19 @@ class ImportStatement(Statement):
     Attributes:
         name (List[str]): Module name.
         alias (Optional[str]): Optional alias for module. Defaults to None.
+        names_set (FrozenSet[str]): Module names as a set for fast membership tests.
+            Computed from `names` on construction.
     """
 
     names: List[str]
     alias: Optional[str] = None
+    names_set: FrozenSet[str] = field(init=False, repr=False, compare=False)
+
+    def __post_init__(self) -> None:
+        self.names_set = frozenset(self.names)
 
 
-@dataclass
+@dataclass(slots=True)
 class ImportFromStatement(Statement):
     """Dataclass for import-from statements.
 
@@ -49,15 +53,21 @@ class ImportFromStatement(Statement):
         names (List[str]): List of submodule names.
         alias (Optional[str]): Optional alias for module. Defaults to None.
         level (int): Relative import level (0 absolute). Defaults to 0.
+        names_set (FrozenSet[str]): Submodule names as a set for order-insensitive
+            comparisons. Computed from `names` on construction.
     """
 
     module: str
     names: List[str]
     alias: Optional[str] = None
     level: int = 0
+    names_set: FrozenSet[str] = field(init=False, repr=False, compare=False)
+
+    def __post_init__(self) -> None:
+        self.names_set = frozenset(self.names)
 
 
-@dataclass
+@dataclass(slots=True)
 class ClassDefStatement(Statement):
     """Dataclass for class definitions.
 
@@ -75,7 +85,7 @@ class ClassDefStatement(Statement):
     body: List["Statement"]
 
 
-@dataclass
+@dataclass(slots=True)
 class FunctionDefStatement(Statement):
     """Dataclass for function definitions.
 
@@ -93,7 +103,7 @@ class FunctionDefStatement(Statement):
     args: List[str] = field(default_factory=list)
 
 
-@dataclass
+@dataclass(slots=True)
 class ForStatement(Statement):
     """Dataclass for For loops.
 
@@ -114,7 +124,7 @@ class ForStatement(Statement):
     orelse: Optional[List["Statement"]] = field(default_factory=list)
 
 
-@dataclass
+@dataclass(slots=True)
 class WithStatement(Statement):
     """Dataclass for With statements
 
@@ -130,7 +140,7 @@ class WithStatement(Statement):
     body: List["Statement"]
 
 
-@dataclass
+@dataclass(slots=True)
 class IfStatement(Statement):
     """Dataclass for If statements
 
@@ -149,7 +159,7 @@ class IfStatement(Statement):
     orelse: Optional[List["Statement"]] = field(default_factory=list)
 
 
-@dataclass
+@dataclass(slots=True)
 class FunctionCallStatement(Statement):
     """Dataclass for function call statements.
 
@@ -164,10 +174,10 @@ class FunctionCallStatement(Statement):
 
     func: str
     args: List[str] = field(default_factory=list)
-    kwargs: Dict[str, str] = field(default_factory=list)
+    kwargs: Dict[str, str] = field(default_factory=dict)
 
 
-@dataclass
+@dataclass(slots=True)
 class AssignStatement(Statement):
     """Dataclass for assignment statements.
 
@@ -183,7 +193,7 @@ class AssignStatement(Statement):
     value: Union[str, FunctionCallStatement]
 
 
-@dataclass
+@dataclass(slots=True)
 class ExprStatement(Statement):
     """Dataclass for other expression statements such as comments or docstrings.
 
@@ -197,7 +207,7 @@ class ExprStatement(Statement):
     value: str
 
 
-@dataclass
+@dataclass(slots=True)
 class GenericStatement(Statement):
     """Dataclass for other statement types such as break or try-except.
 
@@ -209,3 +219,80 @@ class GenericStatement(Statement):
     """
 
     type_name: str
+
+
+@dataclass(slots=True)
+class StatementIndex:
+    """Lookup tables over a list of parsed top-level statements.
+
+    Built in a single pass over the statements so the `find_*` helpers in utils can
+    answer each query without rescanning the whole list.
+
+    Attributes:
+        func_defs (Dict[str, FunctionDefStatement]): First function definition for
+            each function name.
+        class_defs (Dict[str, ClassDefStatement]): First class definition for each
+            class name.
+        calls_by_name (Dict[str, List[Statement]]): Function call statements and
+            assignments from function calls, grouped by the called function name.
+        calls_by_prefix (Dict[str, List[Statement]]): The same call statements,
+            grouped by the first dotted component of the function name (e.g. "np"
+            for "np.random.rand").
+        imports_by_module (Dict[str, List[ImportStatement]]): Import statements
+            grouped by each module name they import.
+        importfrom_by_module (Dict[str, List[ImportFromStatement]]): Import-from
+            statements grouped by the module they import from.
+    """
+
+    func_defs: Dict[str, FunctionDefStatement] = field(default_factory=dict)
+    class_defs: Dict[str, ClassDefStatement] = field(default_factory=dict)
+    calls_by_name: Dict[str, List[Statement]] = field(default_factory=dict)
+    calls_by_prefix: Dict[str, List[Statement]] = field(default_factory=dict)
+    imports_by_module: Dict[str, List[ImportStatement]] = field(default_factory=dict)
+    importfrom_by_module: Dict[str, List[ImportFromStatement]] = field(
+        default_factory=dict
+    )
+
+    @classmethod
+    def from_statements(cls, statements: Iterable[Statement]) -> "StatementIndex":
+        """Builds an index over the given statements.
+
+        Args:
+            statements (Iterable[Statement]): Parsed statements to index.
+
+        Returns:
+            StatementIndex: Index of the statements, with each table in their
+                original order.
+        """
+        index = cls()
+        for statement in statements:
+            index.add(statement)
+        return index
+
+    def add(self, statement: Statement) -> None:
+        """Adds a statement to the index.
+
+        Args:
+            statement (Statement): Parsed statement to index.
+        """
+        statement_type = type(statement)
+        if statement_type is FunctionCallStatement:
+            self._add_call(statement.func, statement)
+        elif statement_type is AssignStatement:
+            if type(statement.value) is FunctionCallStatement:
+                self._add_call(statement.value.func, statement)
+        elif statement_type is FunctionDefStatement:
+            self.func_defs.setdefault(statement.name, statement)
+        elif statement_type is ClassDefStatement:
+            self.class_defs.setdefault(statement.name, statement)
+        elif statement_type is ImportStatement:
+            for name in statement.names_set:
+                self.imports_by_module.setdefault(name, []).append(statement)
+        elif statement_type is ImportFromStatement:
+            module = statement.module
+            self.importfrom_by_module.setdefault(module, []).append(statement)
+
+    def _add_call(self, func: str, statement: Statement) -> None:
+        self.calls_by_name.setdefault(func, []).append(statement)
+        root = func.split(".", 1)[0]
+        self.calls_by_prefix.setdefault(root, []).append(statement)
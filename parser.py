@@ -7,7 +7,9 @@ import sys
 sys.path.append("/challenge")
 
 import ast
-from typing import Dict, List, Optional
+import functools
+import operator
+from typing import Any, Dict, Iterator, List, Optional
 
 from .datatypes import (
     Statement,
@@ -22,20 +24,286 @@ from .datatypes import (
     FunctionCallStatement,
     ExprStatement,
     GenericStatement,
+    StatementIndex,
 )
 
+# Maps AST statement types to the name of the StatementParser method that parses
+# them. Expr nodes are handled separately since they depend on their value type.
+_STATEMENT_PARSERS = {
+    ast.Import: "_parse_import_statement",
+    ast.ImportFrom: "_parse_importfrom_statement",
+    ast.ClassDef: "_parse_class_definition",
+    ast.FunctionDef: "_parse_function_definition",
+    ast.For: "_parse_for_loop",
+    ast.With: "_parse_with_statement",
+    ast.If: "_parse_if_statement",
+    ast.Assign: "_parse_assign_statement",
+}
+
+# Fields of each compound statement type that hold nested statements, in AST field
+# order. Clause fields hold except handlers or match cases, each with its own body.
+_STATEMENT_LIST_FIELDS = {
+    ast.ClassDef: ("body",),
+    ast.FunctionDef: ("body",),
+    ast.AsyncFunctionDef: ("body",),
+    ast.For: ("body", "orelse"),
+    ast.AsyncFor: ("body", "orelse"),
+    ast.While: ("body", "orelse"),
+    ast.If: ("body", "orelse"),
+    ast.With: ("body",),
+    ast.AsyncWith: ("body",),
+    ast.Try: ("body", "handlers", "orelse", "finalbody"),
+    ast.Match: ("cases",),
+}
+if hasattr(ast, "TryStar"):
+    _STATEMENT_LIST_FIELDS[ast.TryStar] = _STATEMENT_LIST_FIELDS[ast.Try]
+_CLAUSE_FIELDS = frozenset({"handlers", "cases"})
+
+# Statement-list fields filled in by `_build_body` for the compound statements that
+# have their own dataclass, which uses the same attribute names as the AST node.
+_NESTED_BODIES = {
+    node_type: _STATEMENT_LIST_FIELDS[node_type]
+    for node_type in (ast.ClassDef, ast.FunctionDef, ast.For, ast.With, ast.If)
+}
+
+
+def _statement_lists(node: ast.stmt) -> Iterator[List[ast.stmt]]:
+    # Yields every statement list nested directly in node, including the bodies
+    # of except handlers and match cases.
+    for field_name in _STATEMENT_LIST_FIELDS.get(type(node), ()):
+        value = getattr(node, field_name)
+        if field_name in _CLAUSE_FIELDS:
+            for clause in value:
+                yield clause.body
+        elif value:
+            yield value
+
+
+@functools.lru_cache(maxsize=32)
+def _parse_source(source: bytes, filename: str) -> ast.Module:
+    # Trees are cached by file contents, so a submission that is checked several
+    # times is only parsed once per process while an edited file is always parsed
+    # again. Only the tree is shared between StatementParser instances since it is
+    # never modified; statements and variables are built per parser.
+    return ast.parse(source, filename=filename)
+
+
+def _dotted_name(node: ast.AST) -> Optional[str]:
+    # Renders names and attribute chains on names (e.g. "np.random.rand") straight
+    # from the AST fields. These are most of what gets unparsed, and this produces
+    # exactly what ast.unparse would without going through its visitor.
+    attrs = []
+    while type(node) is ast.Attribute:
+        attrs.append(node.attr)
+        node = node.value
+    if type(node) is not ast.Name:
+        return None
+    attrs.append(node.id)
+    return ".".join(reversed(attrs))
+
+
+def _unparse(node: ast.AST) -> str:
+    return _dotted_name(node) or ast.unparse(node)
+
+
+# Operators and builtins _ConstantFolder may apply when evaluating assignments.
+# Builtins are limited to pure functions of their arguments, so evaluating a
+# submission's expressions can never run code from the submission itself.
+_BINARY_OPERATORS = {
+    ast.Add: operator.add,
+    ast.Sub: operator.sub,
+    ast.Mult: operator.mul,
+    ast.MatMult: operator.matmul,
+    ast.Div: operator.truediv,
+    ast.FloorDiv: operator.floordiv,
+    ast.Mod: operator.mod,
+    ast.Pow: operator.pow,
+    ast.LShift: operator.lshift,
+    ast.RShift: operator.rshift,
+    ast.BitOr: operator.or_,
+    ast.BitXor: operator.xor,
+    ast.BitAnd: operator.and_,
+}
+_UNARY_OPERATORS = {
+    ast.UAdd: operator.pos,
+    ast.USub: operator.neg,
+    ast.Not: operator.not_,
+    ast.Invert: operator.invert,
+}
+_COMPARE_OPERATORS = {
+    ast.Eq: operator.eq,
+    ast.NotEq: operator.ne,
+    ast.Lt: operator.lt,
+    ast.LtE: operator.le,
+    ast.Gt: operator.gt,
+    ast.GtE: operator.ge,
+    ast.Is: operator.is_,
+    ast.IsNot: operator.is_not,
+    ast.In: lambda left, right: left in right,
+    ast.NotIn: lambda left, right: left not in right,
+}
+_SAFE_BUILTINS = {
+    "abs": abs,
+    "bool": bool,
+    "dict": dict,
+    "float": float,
+    "int": int,
+    "len": len,
+    "list": list,
+    "max": max,
+    "min": min,
+    "range": range,
+    "round": round,
+    "set": set,
+    "sorted": sorted,
+    "str": str,
+    "sum": sum,
+    "tuple": tuple,
+}
+# Calls are only evaluated when the callee is one of these exact objects.
+_SAFE_BUILTIN_IDS = frozenset(id(builtin) for builtin in _SAFE_BUILTINS.values())
+# FormattedValue.conversion holds the conversion character's code point, or -1.
+_FORMAT_CONVERSIONS = {-1: None, ord("s"): str, ord("r"): repr, ord("a"): ascii}
+
+
+class _ConstantFolder(ast.NodeVisitor):
+    """Statically evaluates an expression against already resolved variables.
+
+    Supports literals, names, operators, containers, subscripts, f-strings and calls
+    to a small set of pure builtins. Any other node raises ValueError, the same
+    error `ast.literal_eval` raises for unsupported input.
+    """
 
-class StatementParser(ast.NodeVisitor):
-    """Parser to convert Python code to custom dataclasses.
+    def __init__(self, variables: Dict) -> None:
+        self.variables = variables
 
-    Args:
-        ast.NodeVisitor (class): Node visitor base class.
-    """
+    def visit(self, node: ast.AST) -> Any:
+        # Looks the handler up in _FOLDER_DISPATCH rather than formatting a
+        # "visit_<name>" string and calling getattr for every node.
+        return _FOLDER_DISPATCH.get(type(node), _ConstantFolder.generic_visit)(
+            self, node
+        )
+
+    def generic_visit(self, node: ast.AST) -> Any:
+        raise ValueError(f"Cannot evaluate {type(node).__name__} statically")
+
+    def visit_Constant(self, node: ast.Constant) -> Any:
+        return node.value
+
+    def visit_Name(self, node: ast.Name) -> Any:
+        if node.id in self.variables:
+            return self.variables[node.id]
+        if node.id in _SAFE_BUILTINS:
+            return _SAFE_BUILTINS[node.id]
+        raise ValueError(f"Unresolved name {node.id}")
+
+    def visit_Tuple(self, node: ast.Tuple) -> tuple:
+        return tuple(self._visit_elements(node.elts))
+
+    def visit_List(self, node: ast.List) -> list:
+        return self._visit_elements(node.elts)
+
+    def visit_Set(self, node: ast.Set) -> set:
+        return set(self._visit_elements(node.elts))
+
+    def visit_Dict(self, node: ast.Dict) -> dict:
+        result = {}
+        for key, value in zip(node.keys, node.values):
+            if key is None:
+                result.update(self.visit(value))
+            else:
+                result[self.visit(key)] = self.visit(value)
+        return result
+
+    def visit_UnaryOp(self, node: ast.UnaryOp) -> Any:
+        return _UNARY_OPERATORS[type(node.op)](self.visit(node.operand))
+
+    def visit_BinOp(self, node: ast.BinOp) -> Any:
+        left = self.visit(node.left)
+        right = self.visit(node.right)
+        return _BINARY_OPERATORS[type(node.op)](left, right)
+
+    def visit_BoolOp(self, node: ast.BoolOp) -> Any:
+        is_and = type(node.op) is ast.And
+        for value_node in node.values:
+            value = self.visit(value_node)
+            if bool(value) is not is_and:
+                return value
+        return value
+
+    def visit_Compare(self, node: ast.Compare) -> bool:
+        left = self.visit(node.left)
+        for op, comparator in zip(node.ops, node.comparators):
+            right = self.visit(comparator)
+            if not _COMPARE_OPERATORS[type(op)](left, right):
+                return False
+            left = right
+        return True
+
+    def visit_IfExp(self, node: ast.IfExp) -> Any:
+        return self.visit(node.body if self.visit(node.test) else node.orelse)
+
+    def visit_Subscript(self, node: ast.Subscript) -> Any:
+        return self.visit(node.value)[self.visit(node.slice)]
+
+    def visit_Slice(self, node: ast.Slice) -> slice:
+        lower = self.visit(node.lower) if node.lower else None
+        upper = self.visit(node.upper) if node.upper else None
+        step = self.visit(node.step) if node.step else None
+        return slice(lower, upper, step)
+
+    def visit_JoinedStr(self, node: ast.JoinedStr) -> str:
+        return "".join(self.visit(value) for value in node.values)
+
+    def visit_FormattedValue(self, node: ast.FormattedValue) -> str:
+        value = self.visit(node.value)
+        conversion = _FORMAT_CONVERSIONS[node.conversion]
+        if conversion:
+            value = conversion(value)
+        format_spec = self.visit(node.format_spec) if node.format_spec else ""
+        return format(value, format_spec)
+
+    def visit_Call(self, node: ast.Call) -> Any:
+        func = self.visit(node.func)
+        if id(func) not in _SAFE_BUILTIN_IDS:
+            raise ValueError("Only calls to pure builtins can be evaluated")
+        args = self._visit_elements(node.args)
+        kwargs = {}
+        for keyword in node.keywords:
+            if keyword.arg is None:
+                kwargs.update(self.visit(keyword.value))
+            else:
+                kwargs[keyword.arg] = self.visit(keyword.value)
+        return func(*args, **kwargs)
+
+    def _visit_elements(self, nodes: List[ast.expr]) -> list:
+        values = []
+        for element in nodes:
+            if type(element) is ast.Starred:
+                values.extend(self.visit(element.value))
+            else:
+                values.append(self.visit(element))
+        return values
+
+
+# Maps each AST node type to the _ConstantFolder method that evaluates it.
+_FOLDER_DISPATCH = {
+    getattr(ast, name[len("visit_") :]): method
+    for name, method in vars(_ConstantFolder).items()
+    if name.startswith("visit_")
+}
+
+
+class StatementParser:
+    """Parser to convert Python code to custom dataclasses."""
 
     def __init__(self, filepath: str) -> None:
-        super(StatementParser).__init__()
         self.filepath = filepath
         self.tree = self._get_file_contents()
+        self._statements: Optional[List[Statement]] = None
+        self._index: Optional[StatementIndex] = None
+        self._variables: Dict = {}
+        self._constant_folder = _ConstantFolder(self._variables)
 
     def parse(self) -> List[Statement]:
         """Parses a Python source file into a list of Statement objects.
@@ -43,8 +311,9 @@ class StatementParser(ast.NodeVisitor):
         This method constructs an Abstract Syntax Tree (AST), and processes each
         top-level node to create corresponding Statement dataclasses. Each node is
         processed using the `_process_statement` method, and the resulting statements
-        are collected if they are not None. The method also traverses the AST using
-        the `visit` method for further processing.
+        are collected if they are not None. Nested bodies are filled in by
+        `_build_body` without recursion, so the tree is only traversed once. Variable
+        values for `retrieve_variable_values` are collected during the same pass.
 
         Args:
             filepath (str): The path to the Python source file to parse.
@@ -58,79 +327,111 @@ class StatementParser(ast.NodeVisitor):
                 into a specific Statement type, a GenericStatement may be included.
         """
 
-        parsed_statements = []
-        for node in self.tree.body:
-            stmt = self._process_statement(node)
-            if stmt:
-                parsed_statements.append(stmt)
-            self.visit(node)
-        return parsed_statements
+        if self._statements is None:
+            self._statements = self._build_body(self.tree.body)
+        return list(self._statements)
+
+    def index(self) -> StatementIndex:
+        """Builds lookup tables over the parsed top-level statements.
+
+        The index is built once per parser and can be passed to the `find_*` helpers
+        in utils in place of the statement list returned by `parse`.
+
+        Returns:
+            StatementIndex: Index over the statements returned by `parse`.
+        """
+
+        if self._index is None:
+            self._index = StatementIndex.from_statements(self.parse())
+        return self._index
 
     def retrieve_variable_values(self) -> Dict:
         """Retrieves all variables defined in Python file and their values.
 
+        The values are collected while parsing, so this runs `parse` first if it
+        has not been run by this parser yet. Assignments are applied in source order,
+        so a variable assigned more than once keeps the value of its last assignment
+        in the file, including assignments nested in compound statements.
+
         Returns:
             Dict: Key value pairs of variable names and their values
         """
 
-        variables = {}
-        for node in ast.walk(self.tree):
-            if isinstance(node, ast.Assign):
-                for target in node.targets:
-                    if isinstance(target, ast.Name):
-                        try:
-                            value = ast.literal_eval(node.value)
-                            variables[target.id] = value
-                        except ValueError:
-                            try:
-                                expression_code = compile(
-                                    ast.Expression(node.value), "<ast>", "eval"
-                                )
-                                value = eval(expression_code, {}, variables)
-                                variables[target.id] = value
-                            except Exception:
-                                variables[target.id] = "Unresolvable dynamic value"
-
-        return variables
+        if self._statements is None:
+            self.parse()
+        return dict(self._variables)
+
+    def _build_body(self, nodes: List[ast.stmt]) -> List[Statement]:
+        # Uses an explicit stack instead of recursing through the _parse_*
+        # helpers so deeply nested submissions cannot hit the recursion limit.
+        # Compound statements are created with empty bodies, and their child
+        # nodes are pushed together with the list they should be appended to.
+        # Bodies of statements without a dedicated dataclass (while, try, ...) are
+        # pushed without a destination and only scanned for variable assignments.
+        # A nested body is finished before the rest of its parent body, so
+        # assignments are recorded in source order.
+        parsed_statements = []
+        stack = [(iter(nodes), parsed_statements)]
+        while stack:
+            body_nodes, destination = stack[-1]
+            for node in body_nodes:
+                if destination is None:
+                    if type(node) is ast.Assign:
+                        self._record_variables(node)
+                    nested = [(iter(body), None) for body in _statement_lists(node)]
+                else:
+                    stmt = self._process_statement(node)
+                    if not stmt:
+                        continue
+                    destination.append(stmt)
+                    if type(stmt) is GenericStatement:
+                        nested = [
+                            (iter(body), None) for body in _statement_lists(node)
+                        ]
+                    else:
+                        nested = [
+                            (iter(getattr(node, field_name)), getattr(stmt, field_name))
+                            for field_name in _NESTED_BODIES.get(type(node), ())
+                        ]
+                if nested:
+                    stack.extend(reversed(nested))
+                    break
+            else:
+                stack.pop()
+        return parsed_statements
 
-    def _process_statement(self, node: ast.AST) -> Optional[Statement]:
-        statement_parsers = {
-            ast.Import: self._parse_import_statement,
-            ast.ImportFrom: self._parse_importfrom_statement,
-            ast.ClassDef: self._parse_class_definition,
-            ast.FunctionDef: self._parse_function_definition,
-            ast.For: self._parse_for_loop,
-            ast.With: self._parse_with_statement,
-            ast.If: self._parse_if_statement,
-            ast.Assign: self._parse_assign_statement,
-        }
-
-        if isinstance(node, ast.Expr) and isinstance(node.value, ast.Call):
-            return self._parse_function_call(node)
-
-        if isinstance(node, ast.Expr):
-            return self._parse_expression_statement(node)
+    def _record_variables(self, node: ast.Assign) -> None:
+        names = [target.id for target in node.targets if type(target) is ast.Name]
+        if not names:
+            return
 
-        parser = statement_parsers.get(type(node))
-        if parser:
-            return parser(node)
+        # _ConstantFolder accepts everything ast.literal_eval does, so it is the only
+        # evaluator and an exception is raised only for unresolvable values.
+        try:
+            value = self._constant_folder.visit(node.value)
+        except Exception:
+            value = "Unresolvable dynamic value"
+        for name in names:
+            self._variables[name] = value
 
-        return GenericStatement(type_name=node.__class__.__name__)
+    def _process_statement(self, node: ast.AST) -> Optional[Statement]:
+        node_type = type(node)
+        if node_type is ast.Expr:
+            if type(node.value) is ast.Call:
+                return self._parse_function_call(node)
+            return self._parse_expression_statement(node)
 
-    def generic_visit(self, node):
-        if hasattr(node, "body"):
-            for stmt in node.body:
-                self.visit(stmt)
-            if hasattr(node, "orelse"):
-                for stmt in node.orelse:
-                    self.visit(stmt)
+        parser_name = _STATEMENT_PARSERS.get(node_type)
+        if parser_name:
+            return getattr(self, parser_name)(node)
+        return GenericStatement(node_type.__name__)
 
     @staticmethod
     def _parse_import_statement(node: ast.AST) -> ImportStatement:
         names = [name.name for name in node.names]
         # Use the first alias if available, otherwise None
         alias = node.names[0].asname if node.names and node.names[0].asname else None
-        return ImportStatement(names=names, alias=alias)
+        return ImportStatement(names, alias)
 
     @staticmethod
     def _parse_importfrom_statement(node: ast.AST) -> ImportFromStatement:
@@ -142,85 +443,70 @@ class StatementParser(ast.NodeVisitor):
         )
 
     def _parse_class_definition(self, node: ast.AST) -> ClassDefStatement:
-        bases = [ast.unparse(base) for base in node.bases]
-        body = [self._process_statement(stmt) for stmt in node.body]
-        return ClassDefStatement(
-            name=node.name, bases=bases, body=[stmt for stmt in body if stmt]
-        )
+        bases = [_unparse(base) for base in node.bases]
+        return ClassDefStatement(name=node.name, bases=bases, body=[])
 
     def _parse_function_definition(self, node: ast.AST) -> FunctionDefStatement:
         args = [arg.arg for arg in node.args.args]
-        body = [self._process_statement(stmt) for stmt in node.body]
-        return FunctionDefStatement(
-            name=node.name, args=args, body=[stmt for stmt in body if stmt]
-        )
+        return FunctionDefStatement(name=node.name, args=args, body=[])
 
     def _parse_for_loop(self, node: ast.AST) -> ForStatement:
-        target = ast.unparse(node.target) if node.target else ""
-        iter_expr = ast.unparse(node.iter) if node.iter else ""
-        body = [self._process_statement(stmt) for stmt in node.body]
-        orelse = [self._process_statement(stmt) for stmt in node.orelse]
-        return ForStatement(
-            target=target,
-            iter=iter_expr,
-            body=[stmt for stmt in body if stmt],
-            orelse=[stmt for stmt in orelse if stmt],
-        )
+        target = _unparse(node.target) if node.target else ""
+        iter_expr = _unparse(node.iter) if node.iter else ""
+        return ForStatement(target=target, iter=iter_expr, body=[], orelse=[])
 
     def _parse_with_statement(self, node: ast.AST) -> WithStatement:
         items = [
             (
-                ast.unparse(item.context_expr),
-                ast.unparse(item.optional_vars) if item.optional_vars else None,
+                _unparse(item.context_expr),
+                _unparse(item.optional_vars) if item.optional_vars else None,
             )
             for item in node.items
         ]
-        body = [self._process_statement(stmt) for stmt in node.body]
-        return WithStatement(items=items, body=[stmt for stmt in body if stmt])
+        return WithStatement(items=items, body=[])
 
     def _parse_if_statement(self, node: ast.AST) -> IfStatement:
-        test = ast.unparse(node.test) if node.test else ""
-        body = [self._process_statement(stmt) for stmt in node.body]
-        orelse = [self._process_statement(stmt) for stmt in node.orelse]
-        return IfStatement(
-            test=test,
-            body=[stmt for stmt in body if stmt],
-            orelse=[stmt for stmt in orelse if stmt],
-        )
+        test = _unparse(node.test) if node.test else ""
+        return IfStatement(test=test, body=[], orelse=[])
 
     def _parse_assign_statement(self, node: ast.AST) -> AssignStatement:
+        self._record_variables(node)
         targets = []
         for target in node.targets:
-            if isinstance(target, ast.Tuple):
+            if type(target) is ast.Tuple:
                 for elt in target.elts:
-                    if isinstance(elt, ast.Name):
+                    if type(elt) is ast.Name:
                         targets.append(elt.id)
                     else:
-                        targets.append(ast.unparse(elt))
+                        targets.append(_unparse(elt))
             else:
-                targets.append(ast.unparse(target))
+                targets.append(_unparse(target))
 
-        if isinstance(node.value, ast.Call):
+        if type(node.value) is ast.Call:
             value = self._parse_function_call(ast.Expr(value=node.value))
         else:
-            value = ast.unparse(node.value) if node.value else ""
-        return AssignStatement(targets=targets, value=value)
+            value = _unparse(node.value) if node.value else ""
+        return AssignStatement(targets, value)
 
     @staticmethod
     def _parse_function_call(node: ast.AST) -> FunctionCallStatement:
-        func = ast.unparse(node.value.func)
-        args = [ast.unparse(arg) for arg in node.value.args]
-        kwargs = {kw.arg: ast.unparse(kw.value) for kw in node.value.keywords}
-        return FunctionCallStatement(func=func, args=args, kwargs=kwargs)
+        # Dotted names such as "np.array" are rebuilt by unparse, unlike plain
+        # identifiers which the AST already interns, so intern them here to let the
+        # name comparisons in utils short-circuit on identity.
+        func = sys.intern(_unparse(node.value.func))
+        args = [_unparse(arg) for arg in node.value.args]
+        kwargs = {kw.arg: _unparse(kw.value) for kw in node.value.keywords}
+        return FunctionCallStatement(func, args, kwargs)
 
     @staticmethod
     def _parse_expression_statement(node: ast.AST) -> ExprStatement:
-        value = ast.unparse(node.value) if node.value else ""
-        return ExprStatement(value=value)
+        value = _unparse(node.value) if node.value else ""
+        return ExprStatement(value)
 
     def _get_file_contents(self) -> ast.Module:
         try:
-            with open(self.filepath, "r", encoding="utf-8") as file:
-                return ast.parse(file.read(), filename=self.filepath)
+            with open(self.filepath, "rb") as file:
+                source = file.read()
         except FileNotFoundError as e:
             raise FileNotFoundError(f"File not found: {self.filepath}") from e
+        return _parse_source(source, self.filepath)
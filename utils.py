@@ -6,7 +6,7 @@ import sys
 
 sys.path.append("/challenge")
 
-from typing import List, Optional
+from typing import Dict, Iterable, List, Optional, Union
 
 from .config import GREEN_TEXT_CODE, RED_TEXT_CODE, RESET_CODE
 from .datatypes import (
@@ -17,28 +17,62 @@ from .datatypes import (
     ImportStatement,
     ImportFromStatement,
     Statement,
+    StatementIndex,
 )
+from .parser import StatementParser
+
+# Contents of /flag, read on first use. The file does not change while the
+# verifier runs, so it is only opened once.
+_FLAG: Optional[str] = None
+
+
+def _get_flag() -> str:
+    global _FLAG
+    if _FLAG is None:
+        try:
+            with open("/flag", "r", encoding="utf-8") as f:
+                _FLAG = f.read()
+        except FileNotFoundError:
+            return "Error: Flag file not found."
+    return _FLAG
 
 
 def print_flag() -> None:
     """Prints flag upon successful completion of the challenge."""
-    try:
-        with open("/flag", "r", encoding="utf-8") as f:
-            print(f.read())
-    except FileNotFoundError:
-        print("Error: Flag file not found.")
+    print(_get_flag())
 
 
-def run_verification(checks: List[callable]) -> None:
+def run_verification(checks: List[callable], filepath: Optional[str] = None) -> None:
     """Runs a sequence of validation checks, prints results, and handles
     success/failure.
 
+    When `filepath` is given, the submission is parsed once before the checks run
+    and its StatementParser is passed to each check, so the checks share its cached
+    `parse`, `index` and `retrieve_variable_values` results. A submission that is
+    missing or cannot be parsed fails the first step.
+
     Args:
         checks (list[callable]): List of check functions, each return
-                                 (is_correct: bool, error_msg: str).
+                                 (is_correct: bool, error_msg: str). Checks take
+                                 the StatementParser as their only argument when
+                                 `filepath` is given, and no arguments otherwise.
+        filepath (Optional[str]): Path of the submission to parse for the checks.
+            Defaults to None.
     """
+    parser = None
+    if filepath is not None:
+        try:
+            parser = StatementParser(filepath)
+        except (OSError, SyntaxError, ValueError) as e:
+            print(f"{RED_TEXT_CODE}Step 1 Failed{RESET_CODE}")
+            print(e)
+            sys.exit(1)
+
     for step, check_func in enumerate(checks, 1):
-        is_correct, error_msg = check_func()
+        if parser is None:
+            is_correct, error_msg = check_func()
+        else:
+            is_correct, error_msg = check_func(parser)
         if not is_correct:
             print(f"{RED_TEXT_CODE}Step {step} Failed{RESET_CODE}")
             print(error_msg)
@@ -74,86 +108,179 @@ def function_not_called(function_calls: List[FunctionCallStatement]) -> bool:
 
 
 def find_function_calls(
-    statements: List[Statement], function_name: str
+    statements: Union[List[Statement], StatementIndex], function_name: str
 ) -> List[Statement]:
     """Searches through list of parsed Python statements and returns all lines that
     match given function name.
 
     Args:
-        statements (List[Statement]): List of parsed Python statements.
+        statements (Union[List[Statement], StatementIndex]): List of parsed Python
+            statements, or an index built from them.
         function_name (str): Name of function to search for.
 
     Returns:
         List[FunctionCallStatement]: List of parsed Python lines that match given
             function name.
     """
+    function_name = sys.intern(function_name)
+    if isinstance(statements, StatementIndex):
+        return list(statements.calls_by_name.get(function_name, ()))
+
     function_calls = []
+    # Statement types are never subclassed, so exact type checks are used in the
+    # finders below instead of the slower isinstance.
     for statement in statements:
-        is_function_call_statement = (
-            isinstance(statement, FunctionCallStatement)
-            and statement.func == function_name
-        )
-        is_assign_statement = (
-            isinstance(statement, AssignStatement)
-            and isinstance(statement.value, FunctionCallStatement)
-            and statement.value.func == function_name
-        )
-        if is_function_call_statement or is_assign_statement:
+        statement_type = type(statement)
+        if statement_type is FunctionCallStatement:
+            if statement.func == function_name:
+                function_calls.append(statement)
+        elif statement_type is AssignStatement:
+            value = statement.value
+            if type(value) is FunctionCallStatement and value.func == function_name:
+                function_calls.append(statement)
+    return function_calls
+
+
+def find_function_calls_many(
+    statements: Union[List[Statement], StatementIndex], function_names: Iterable[str]
+) -> Dict[str, List[Statement]]:
+    """Searches through list of parsed Python statements once and groups all lines
+    that call any of the given function names.
+
+    Args:
+        statements (Union[List[Statement], StatementIndex]): List of parsed Python
+            statements, or an index built from them.
+        function_names (Iterable[str]): Names of functions to search for.
+
+    Returns:
+        Dict[str, List[Statement]]: Mapping of each function name to the parsed Python
+            lines that call it, in the same form returned by `find_function_calls`.
+    """
+    if isinstance(statements, StatementIndex):
+        return {
+            name: list(statements.calls_by_name.get(sys.intern(name), ()))
+            for name in function_names
+        }
+
+    function_calls = {sys.intern(name): [] for name in function_names}
+    for statement in statements:
+        statement_type = type(statement)
+        if statement_type is FunctionCallStatement:
+            func = statement.func
+        elif (
+            statement_type is AssignStatement
+            and type(statement.value) is FunctionCallStatement
+        ):
+            func = statement.value.func
+        else:
+            continue
+        if func in function_calls:
+            function_calls[func].append(statement)
+    return function_calls
+
+
+def find_function_calls_by_prefix(
+    statements: Union[List[Statement], StatementIndex], prefix: str
+) -> List[Statement]:
+    """Searches through list of parsed Python statements and returns all lines that
+    call a function under the given dotted prefix.
+
+    The prefix is matched on whole name components, so "np" and "np.random" both
+    match calls to "np.random.rand", while "np.rand" does not.
+
+    Args:
+        statements (Union[List[Statement], StatementIndex]): List of parsed Python
+            statements, or an index built from them.
+        prefix (str): Dotted name prefix to search for, such as "np" or "np.random".
+
+    Returns:
+        List[Statement]: List of parsed Python lines calling the function named
+            `prefix` or any function under it.
+    """
+    dotted_prefix = prefix + "."
+    if isinstance(statements, StatementIndex):
+        root, sep, _ = prefix.partition(".")
+        function_calls = statements.calls_by_prefix.get(root, ())
+        if not sep:
+            return list(function_calls)
+        statements = function_calls
+
+    function_calls = []
+    for statement in statements:
+        statement_type = type(statement)
+        if statement_type is FunctionCallStatement:
+            func = statement.func
+        elif (
+            statement_type is AssignStatement
+            and type(statement.value) is FunctionCallStatement
+        ):
+            func = statement.value.func
+        else:
+            continue
+        if func == prefix or func.startswith(dotted_prefix):
             function_calls.append(statement)
     return function_calls
 
 
 def find_function_definition(
-    statements: List[Statement], function_name: str
+    statements: Union[List[Statement], StatementIndex], function_name: str
 ) -> Optional[FunctionDefStatement]:
     """
     Searches a list of statements for a function definition with the specified name.
 
     Args:
-        statements (List[Statement]): A list of statements to search through.
+        statements (Union[List[Statement], StatementIndex]): A list of statements to
+            search through, or an index built from them.
         function_name (str): The name of the function to find.
 
     Returns:
         FunctionDefStatement: The function definition statement with the matching name,
             or None if not found.
     """
+    if isinstance(statements, StatementIndex):
+        return statements.func_defs.get(function_name)
+
     for statement in statements:
-        if (
-            isinstance(statement, FunctionDefStatement)
-            and statement.name == function_name
-        ):
+        if type(statement) is FunctionDefStatement and statement.name == function_name:
             return statement
     return None
 
 
 def find_class_definition(
-    statements: List[Statement], class_name: str
+    statements: Union[List[Statement], StatementIndex], class_name: str
 ) -> Optional[ClassDefStatement]:
     """
     Searches a list of statements for a class definition with the specified name.
 
     Args:
-        statements (List[Statement]): A list of statements to search through.
+        statements (Union[List[Statement], StatementIndex]): A list of statements to
+            search through, or an index built from them.
         class_name (str): The name of the class to find.
 
     Returns:
         ClassDefStatement: The class definition statement with the matching name, or
             None if not found.
     """
+    if isinstance(statements, StatementIndex):
+        return statements.class_defs.get(class_name)
+
     for statement in statements:
-        if isinstance(statement, ClassDefStatement) and statement.name == class_name:
+        if type(statement) is ClassDefStatement and statement.name == class_name:
             return statement
     return None
 
 
 def find_import_statement(
-    statements: List[Statement], module_name: str, alias: str = None
+    statements: Union[List[Statement], StatementIndex],
+    module_name: str,
+    alias: str = None,
 ) -> Optional[ImportStatement]:
     """
     Searches a list of statements for an import statement with the specified name.
 
     Args:
-        statements (List[Statement]): A list of statements to search through.
+        statements (Union[List[Statement], StatementIndex]): A list of statements to
+            search through, or an index built from them.
         module_name (str): The name of the import to find.
         alias (str): Alias for the import, defaults to None.
 
@@ -161,10 +288,16 @@ def find_import_statement(
         Optional[ImportStatement]: The import statement with the matching name, or None
             if not found.
     """
+    if isinstance(statements, StatementIndex):
+        for statement in statements.imports_by_module.get(module_name, ()):
+            if statement.alias == alias:
+                return statement
+        return None
+
     for statement in statements:
         if (
-            isinstance(statement, ImportStatement)
-            and module_name in statement.names
+            type(statement) is ImportStatement
+            and module_name in statement.names_set
             and statement.alias == alias
         ):
             return statement
@@ -172,7 +305,7 @@ def find_import_statement(
 
 
 def find_import_from_statement(
-    statements: List[Statement],
+    statements: Union[List[Statement], StatementIndex],
     module_name: str,
     submodules: List[str],
     alias: str = None,
@@ -181,7 +314,8 @@ def find_import_from_statement(
     Searches a list of statements for an import from statement with the specified name.
 
     Args:
-        statements (List[Statement]): A list of statements to search through.
+        statements (Union[List[Statement], StatementIndex]): A list of statements to
+            search through, or an index built from them.
         module_name (str): The name of the import to find.
         submodules (List[str]): List of submodules imported from module.
         alias (str): Alias for the import, defaults to None.
@@ -190,11 +324,15 @@ def find_import_from_statement(
         Optional[ImportFromStatement]: The import from statement with the matching name,
             or None if not found.
     """
+    if isinstance(statements, StatementIndex):
+        statements = statements.importfrom_by_module.get(module_name, ())
+
+    submodules_set = frozenset(submodules)
     for statement in statements:
         if (
-            isinstance(statement, ImportFromStatement)
+            type(statement) is ImportFromStatement
             and statement.module == module_name
-            and set(submodules) == set(statement.names)
+            and statement.names_set == submodules_set
             and statement.alias == alias
         ):
             return statement